@@ -5,9 +5,16 @@ Get arXiv papers
 import os
 import json
 import warnings
-import arxiv
-from tqdm import tqdm
-from llm import is_paper_match, translate_abstract, translate_title
+from collections import deque
+from typing import TYPE_CHECKING
+from cassette import active_cassette
+from paper import Paper
+
+if TYPE_CHECKING:
+    import arxiv
+
+# `arxiv`, `tqdm` and the LLM helpers (openai) are imported by the stages that use them,
+# so that keyword filtering and CLI startup do not pay for those dependencies.
 
 warnings.filterwarnings('ignore')
 
@@ -43,10 +50,12 @@ def _coerce_total_results(value):
     raise TypeError('Unsupported type for total results: {}'.format(type(value)))
 
 
-def _iter_results_with_fallback(client: arxiv.Client, search: arxiv.Search, max_results: int):
+def _iter_results_with_fallback(client: 'arxiv.Client', search: 'arxiv.Search', max_results: int):
     """
     Iterate search results with a fallback that tolerates malformed feeds.
     """
+    import arxiv
+
     offset = 0
     yielded = 0
     total_results = None
@@ -116,10 +125,18 @@ def get_latest_papers(category, max_results=100):
     Get the latest papers from arXiv
     :param category: the category of papers
     :param max_results: the maximum number of papers to get
-    :return: a list of papers
+    :return: a list of `Paper` records
     """
+    import arxiv
+
     papers = []
     client = arxiv.Client()
+    cassette = active_cassette()
+    if cassette is not None:
+        cassette.mount(client._session)
+        if cassette.replaying:
+            # Recorded pages are served locally, so the arXiv rate limit does not apply
+            client.delay_seconds = 0
     search_query = f'cat:{category}'
     search = arxiv.Search(
         query=search_query,
@@ -132,13 +149,13 @@ def get_latest_papers(category, max_results=100):
         version_pos = paper_id.find('v')
         if version_pos != -1:
             paper_id = paper_id[:version_pos]
-        papers.append({
-            'title': result_obj.title,
-            'id': paper_id,
-            'abstract': result_obj.summary.replace('\n', ' '),
-            'url': result_obj.entry_id,
-            'published': result_obj.published.date().isoformat()
-        })
+        papers.append(Paper(
+            title=result_obj.title,
+            id=paper_id,
+            abstract=result_obj.summary.replace('\n', ' '),
+            url=result_obj.entry_id,
+            published=result_obj.published.date().isoformat()
+        ))
 
     try:
         for result in client.results(search):
@@ -168,22 +185,17 @@ def deduplicate_papers_across_categories(papers):
     papers_id = set()
     deduplicated_papers = []
     for paper in papers:
-        if paper['id'] not in papers_id:
-            papers_id.add(paper['id'])
+        if paper.id not in papers_id:
+            papers_id.add(paper.id)
             deduplicated_papers.append(paper)
     return deduplicated_papers
 
 
-def filter_papers_by_keyword(papers, keyword_list):
+def _normalize_keywords(keyword_list):
     """
-    Filter papers by keywords
-    :param papers: a list of papers
-    :param keyword_list: a list of keywords
-    :return: a list of filtered papers
+    Parse keyword rules into (rule, groups) pairs, where each group holds the alternatives of one `+` segment
     """
-    results = []
     normalized_keywords = []
-
     for keyword in keyword_list:
         if not keyword:
             continue
@@ -199,45 +211,157 @@ def filter_papers_by_keyword(papers, keyword_list):
                 if variants:
                     groups.append(variants)
         if groups:
-            normalized_keywords.append(groups)
+            normalized_keywords.append((keyword, groups))
+    return normalized_keywords
+
+
+def _match_keywords(searchable_text: str, normalized_keywords):
+    """
+    Return the keyword rules whose every group has an alternative in `searchable_text`
+    """
+    return [
+        keyword for keyword, keyword_groups in normalized_keywords
+        if all(any(alt in searchable_text for alt in group) for group in keyword_groups)
+    ]
 
+
+def filter_papers_by_keyword(papers, keyword_list):
+    """
+    Filter papers by keywords
+    :param papers: a list of papers
+    :param keyword_list: a list of keywords
+    :return: a list of filtered papers, with `keyword_matches` set to the matched keyword rules
+    """
+    results = []
+    normalized_keywords = _normalize_keywords(keyword_list)
     for paper in papers:
-        searchable_text = '{} {}'.format(paper['title'], paper['abstract']).lower()
-        if any(all(any(alt in searchable_text for alt in group) for group in keyword_groups) for keyword_groups in normalized_keywords):
+        searchable_text = '{} {}'.format(paper.title, paper.abstract).lower()
+        keyword_matches = _match_keywords(searchable_text, normalized_keywords)
+        if keyword_matches:
+            paper.keyword_matches = keyword_matches
             results.append(paper)
     return results
 
 
+def _match_chunk(chunk, normalized_keywords):
+    """
+    Match a chunk of (title, abstract) pairs, run in a worker process
+    """
+    return [_match_keywords('{} {}'.format(title, abstract).lower(), normalized_keywords) for title, abstract in chunk]
+
+
+def _bounded_map(executor, fn, iterable, window, *args):
+    """
+    Like `executor.map`, but keeps at most `window` items submitted so that only those are held in memory
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def refilter_papers_by_keyword(file_path, keyword_list, workers=None, chunk_size=2000):
+    """
+    Re-score all stored papers against the keyword rules and write the matches back, without fetching anything
+    :param file_path: the file path of the previous records
+    :param keyword_list: a list of keywords
+    :param workers: the number of worker processes, defaults to the number of CPUs
+    :param chunk_size: the number of papers sent to a worker at once
+    :return: the number of stored papers matched by each keyword rule
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import repeat
+
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    records = json.loads(content) if content else []
+    normalized_keywords = _normalize_keywords(keyword_list)
+    match_counts = {keyword: 0 for keyword, _ in normalized_keywords}
+
+    # The history is loaded whole since it is rewritten in place; chunks of (title, abstract) pairs are
+    # built lazily and only a bounded window of them is in flight at once
+    chunks = (
+        [(record['title'], record['abstract']) for record in records[offset:offset + chunk_size]]
+        for offset in range(0, len(records), chunk_size)
+    )
+
+    def _write_back(chunk_results):
+        offset = 0
+        for matches in chunk_results:
+            for record, keyword_matches in zip(records[offset:offset + len(matches)], matches):
+                record['keyword_matches'] = keyword_matches
+                for keyword in keyword_matches:
+                    match_counts[keyword] += 1
+            offset += len(matches)
+
+    if workers == 1 or len(records) <= chunk_size:
+        # A single chunk is not worth the process start-up cost
+        _write_back(map(_match_chunk, chunks, repeat(normalized_keywords)))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            _write_back(_bounded_map(executor, _match_chunk, chunks, 2 * workers, normalized_keywords))
+
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, file_path)
+    return match_counts
+
+
 def filter_papers_using_llm(papers, paper_to_hunt, config: dict):
     """
     Filter papers using LLM
     :param papers: a list of papers
     :param paper_to_hunt: the prompt describing the paper to hunt for
     :param config: the configuration of LLM Server
-    :return: a list of filtered papers
+    :return: a list of filtered papers; papers the LLM could not judge are dropped, so a later run can retry them
     """
-    results = []
-    for paper in papers:
-        if is_paper_match(paper, paper_to_hunt, config):
-            results.append(paper)
-    return results
+    from concurrent.futures import ThreadPoolExecutor
+    from llm import is_paper_match
 
+    # The actual number of concurrent requests is governed by `llm_scheduler`
+    with ThreadPoolExecutor(max_workers=config.get('llm_max_concurrency', 4)) as executor:
+        matches = list(executor.map(lambda paper: is_paper_match(paper, paper_to_hunt, config), papers))
 
-def deduplicate_papers(papers, file_path):
+    unjudged = [paper for paper, match in zip(papers, matches) if match is None]
+    if unjudged:
+        print('Papers not judged by LLM (service error or budget exhausted), dropped: {}'.format(len(unjudged)))
+        for paper in unjudged:
+            print('  - {}'.format(paper.title))
+    return [paper for paper, match in zip(papers, matches) if match]
+
+
+def load_paper_ids(file_path):
     """
-    Deduplicate papers according to the previous records
-    :param papers: a list of papers
+    Load the ids of the previous records
     :param file_path: the file path of the previous records
-    :return: the deduplicated papers
+    :return: a list of paper ids
     """
     if os.path.exists(file_path):
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         if content:
-            content = json.loads(content)
-            # Filter out the duplicated papers by id
-            content_id = set(d['id'] for d in content)
-            papers = [d for d in papers if d['id'] not in content_id]
+            return [d['id'] for d in json.loads(content)]
+    return []
+
+
+def deduplicate_papers(papers, file_path):
+    """
+    Deduplicate papers according to the previous records
+    :param papers: a list of papers
+    :param file_path: the file path of the previous records
+    :return: the deduplicated papers
+    """
+    content_id = set(load_paper_ids(file_path))
+    if content_id:
+        # Filter out the duplicated papers by id
+        papers = [d for d in papers if d.id not in content_id]
     # if len(set(d['id'] for d in papers)) == len(papers):
     #     return papers
     return papers
@@ -247,7 +371,7 @@ def prepend_to_json_file(file_path, data):
     """
     Prepend data to a JSON file
     :param file_path: the file path
-    :param data: the data to prepend
+    :param data: the papers to prepend
     """
     if os.path.exists(file_path):
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -260,7 +384,7 @@ def prepend_to_json_file(file_path, data):
         content = []
 
     with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data + content, f, indent=4, ensure_ascii=False)
+        json.dump([paper.to_dict() for paper in data] + content, f, indent=4, ensure_ascii=False)
 
 
 def translate_abstracts(papers: list, config: dict):
@@ -270,26 +394,32 @@ def translate_abstracts(papers: list, config: dict):
     :param config: the configuration of LLM Server
     :return: the translated papers
     """
-    for paper in tqdm(papers, desc='Translating Abstracts'):
-        abstract = paper["abstract"]
-        zh_abstract = translate_abstract(abstract, config)
-        paper["zh_abstract"] = zh_abstract if zh_abstract else None
+    from concurrent.futures import ThreadPoolExecutor
+    from tqdm import tqdm
+    from llm import translate_abstract, translate_title
+
+    def _translate(paper):
+        zh_abstract = translate_abstract(paper.abstract, config)
+        paper.zh_abstract = zh_abstract if zh_abstract else None
+
+        zh_title = translate_title(paper.title, config)
+        paper.zh_title = zh_title if zh_title else None
 
-        title = paper["title"]
-        zh_title = translate_title(title, config)
-        paper["zh_title"] = zh_title if zh_title else None
+    # The actual number of concurrent requests is governed by `llm_scheduler`
+    with ThreadPoolExecutor(max_workers=config.get('llm_max_concurrency', 4)) as executor:
+        list(tqdm(executor.map(_translate, papers), total=len(papers), desc='Translating Abstracts'))
     return papers
 
 
 if __name__ == '__main__':
     papers = get_latest_papers('cs.CL', max_results=50)
-    print(json.dumps(papers, indent=4))
+    print(json.dumps([paper.to_dict() for paper in papers], indent=4))
     print()
     keyword_list = ['safety', 'security', 'adversarial', 'jailbreak', 'backdoor', 'hallucination', 'victim']
     results = filter_papers_by_keyword(papers, keyword_list)
-    print(json.dumps(results, indent=4))
+    print(json.dumps([paper.to_dict() for paper in results], indent=4))
     print()
     results = deduplicate_papers(results, 'papers.json')
-    print(json.dumps(results, indent=4))
+    print(json.dumps([paper.to_dict() for paper in results], indent=4))
     print()
     prepend_to_json_file('papers.json', results)
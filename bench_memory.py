@@ -0,0 +1,95 @@
+"""
+Memory Benchmark: `Paper` records vs. plain dicts on a large backfill
+"""
+
+import argparse
+import json
+import tracemalloc
+
+from paper import Paper
+
+
+def _fake_fields(i: int) -> dict:
+    return {
+        'title': 'Paper title number {} about molecule design with large language models'.format(i),
+        'id': '2501.{:05d}'.format(i),
+        'abstract': 'Abstract of paper {}. '.format(i) * 40,
+        'url': 'http://arxiv.org/abs/2501.{:05d}v1'.format(i),
+        'published': '2025-01-{:02d}'.format(i % 28 + 1)
+    }
+
+
+def _dict_flow(num_papers: int, batch_size: int):
+    """
+    The previous flow: dicts mutated in place and copied into card rows per batch
+    """
+    papers = [_fake_fields(i) for i in range(num_papers)]
+    for paper in papers:
+        paper['zh_abstract'] = '中文摘要'
+        paper['zh_title'] = '中文标题'
+    for offset in range(0, len(papers), batch_size):
+        chunk = papers[offset:offset + batch_size]
+        table_rows = [{
+            "index": offset + i + 1,
+            "title": paper['title'],
+            "published": paper['published'],
+            "url": f"[{paper['url']}]({paper['url']})"
+        } for i, paper in enumerate(chunk)]
+        paper_list = [{
+            "counter": offset + i + 1,
+            "title": paper['title'],
+            "zh_title": paper.get('zh_title', None),
+            "abstract": paper['abstract'],
+            "zh_abstract": paper.get('zh_abstract', None),
+            "url": paper['url'],
+            "pdf_url": paper['url'].replace('/abs/', '/pdf/', 1),
+            "published": paper['published']
+        } for i, paper in enumerate(chunk)]
+        json.dumps({'table_rows': table_rows, 'paper_list': paper_list})
+    return papers
+
+
+def _paper_flow(num_papers: int, batch_size: int):
+    papers = [Paper(**_fake_fields(i)) for i in range(num_papers)]
+    for paper in papers:
+        paper.zh_abstract = '中文摘要'
+        paper.zh_title = '中文标题'
+    for offset in range(0, len(papers), batch_size):
+        chunk = papers[offset:offset + batch_size]
+        table_rows = [paper.table_row(offset + i + 1) for i, paper in enumerate(chunk)]
+        paper_list = [paper.card_item(offset + i + 1) for i, paper in enumerate(chunk)]
+        json.dumps({'table_rows': table_rows, 'paper_list': paper_list})
+    return papers
+
+
+def measure(flow, num_papers: int, batch_size: int):
+    """
+    Return (retained, peak) bytes allocated by `flow`
+    """
+    tracemalloc.start()
+    papers = flow(num_papers, batch_size)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del papers
+    return retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory usage of Paper records and dicts.')
+    parser.add_argument('-n', '--num-papers', type=int, default=50000, help='Number of papers in the simulated backfill.')
+    parser.add_argument('--batch-size', type=int, default=10, help='Lark batch size used for card rendering.')
+    args = parser.parse_args()
+
+    print('Backfill of {} papers (batch size {})'.format(args.num_papers, args.batch_size))
+    results = {}
+    for name, flow in (('dict', _dict_flow), ('Paper', _paper_flow)):
+        retained, peak = measure(flow, args.num_papers, args.batch_size)
+        results[name] = retained
+        print('{:>6}: retained {:8.2f} MiB, peak {:8.2f} MiB, {:6.0f} B/paper'.format(
+            name, retained / 2 ** 20, peak / 2 ** 20, retained / args.num_papers))
+    saved = results['dict'] - results['Paper']
+    print('Saved {:.2f} MiB ({:.1%})'.format(saved / 2 ** 20, saved / results['dict']))
+
+
+if __name__ == '__main__':
+    main()
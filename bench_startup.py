@@ -0,0 +1,83 @@
+"""
+Startup Benchmark based on `python -X importtime`
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Target for `--mode once` with LLM features off: importing the CLI plus what the
+# fetch (arxiv) and post (requests) stages load must stay under this budget.
+TARGET_ONCE_NO_LLM_MS = 300
+
+# Modules that must never be loaded when LLM features are off
+LLM_ONLY_MODULES = ('openai', 'httpx', 'pydantic', 'tqdm')
+
+SCENARIOS = {
+    'help': [os.path.join(ROOT_DIR, 'main.py'), '--help'],
+    'import-main': ['-c', 'import main'],
+    'once-no-llm': ['-c', 'import main; import arxiv_paper, lark_post; import arxiv, requests'],
+}
+
+
+def _parse_importtime(stderr: str):
+    """
+    Parse `-X importtime` output into (total microseconds, imported module names)
+    """
+    total_us = 0
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append(name.strip())
+        # Only top-level imports are summed; nested ones are already in their parent's cumulative time
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us, modules
+
+
+def run_scenario(args, repeat: int):
+    """
+    Run a scenario `repeat` times and return (best milliseconds, imported module names)
+    """
+    best_us = None
+    modules = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime'] + args,
+            cwd=ROOT_DIR, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError('Scenario failed: {}\n{}'.format(args, proc.stderr))
+        total_us, modules = _parse_importtime(proc.stderr)
+        if best_us is None or total_us < best_us:
+            best_us = total_us
+    return best_us / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure CLI import time with `python -X importtime`.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs per scenario; the best run is reported.')
+    args = parser.parse_args()
+
+    ok = True
+    for name, scenario_args in SCENARIOS.items():
+        elapsed_ms, modules = run_scenario(scenario_args, args.repeat)
+        loaded = sorted(set(m.split('.')[0] for m in modules) & set(LLM_ONLY_MODULES))
+        print('{:>12}: {:8.1f} ms, {:4d} modules, LLM-only modules loaded: {}'.format(
+            name, elapsed_ms, len(modules), ', '.join(loaded) or 'none'))
+        if loaded:
+            ok = False
+        if name == 'once-no-llm' and elapsed_ms > TARGET_ONCE_NO_LLM_MS:
+            print('once-no-llm exceeds the {} ms target'.format(TARGET_ONCE_NO_LLM_MS))
+            ok = False
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Record/Replay Cassettes for arXiv, LLM and Lark webhook traffic
+"""
+
+import base64
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Optional
+
+CASSETTE_VERSION = 1
+
+_active_cassette = None
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised when a replayed run makes a request that was not recorded
+    """
+
+
+class Cassette:
+    """
+    Exchanges stored on disk as gzip-compressed JSON, keyed by request and replayed in recorded order.
+
+    HTTP exchanges (arXiv pages, webhook posts) are keyed by method and URL, or by a label for URLs that hold
+    credentials, chat completions by a digest of the request payload, so replay does not depend on the order
+    LLM calls are issued in.
+    """
+
+    def __init__(self, path: str, mode: str):
+        if mode not in ('record', 'replay'):
+            raise ValueError('Invalid cassette mode `{}`; expected `record` or `replay`.'.format(mode))
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        # Paper ids already in the history file when recording; replay deduplicates against these
+        self.history_ids = []
+        self.interactions = {}
+        self.misses = []
+        self._cursors = {}
+        self._lock = threading.Lock()
+        if mode == 'replay':
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError('Cassette not found at {}'.format(self.path))
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            content = json.load(f)
+        if content.get('version') != CASSETTE_VERSION:
+            raise ValueError('Unsupported cassette version: {}'.format(content.get('version')))
+        self.history_ids = content['history_ids']
+        self.interactions = content['interactions']
+
+    def save(self):
+        content = {
+            'version': CASSETTE_VERSION,
+            'history_ids': self.history_ids,
+            'interactions': self.interactions
+        }
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            json.dump(content, f, ensure_ascii=False, separators=(',', ':'))
+
+    def exchange(self, kind: str, key: str, perform: Callable[[], dict]) -> dict:
+        """
+        Record the JSON-serializable result of `perform()`, or return the next recorded result for `key`
+        :param kind: the kind of exchange, e.g. `http` or `chat`
+        :param key: the request key
+        :param perform: performs the live request, only called when recording
+        :return: the exchange result
+        """
+        key = '{} {}'.format(kind, key)
+        if not self.replaying:
+            result = perform()
+            with self._lock:
+                self.interactions.setdefault(key, []).append(result)
+            return result
+
+        with self._lock:
+            cursor = self._cursors.get(key, 0)
+            recorded = self.interactions.get(key, [])
+            if cursor >= len(recorded):
+                self.misses.append(key)
+                raise CassetteMiss('No recorded exchange left for {}'.format(key))
+            self._cursors[key] = cursor + 1
+            return recorded[cursor]
+
+    def mount(self, session, label: Optional[str] = None):
+        """
+        Route all traffic of a `requests` session through the cassette
+        :param label: key the session's requests by this label instead of their URL, which is then not written
+            to the cassette, e.g. for webhook URLs that embed a secret token
+        """
+        adapter = _CassetteAdapter(self, label)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self, check_misses: bool = True):
+        """
+        Save a recording, or raise `CassetteMiss` if `check_misses` and the replay made unrecorded requests
+        """
+        if not self.replaying:
+            self.save()
+            print('Recorded {} exchanges to cassette {}'.format(
+                sum(len(results) for results in self.interactions.values()), self.path))
+        elif check_misses and self.misses:
+            raise CassetteMiss('Replay made {} unrecorded requests, first: {}'.format(len(self.misses), self.misses[0]))
+
+
+class _CassetteAdapter:
+    """
+    A `requests` transport adapter that records or replays responses through a cassette
+    """
+
+    def __init__(self, cassette: Cassette, label: Optional[str] = None):
+        from requests.adapters import HTTPAdapter
+
+        self._cassette = cassette
+        self._label = label
+        self._adapter = HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        def _perform():
+            response = self._adapter.send(request, **kwargs)
+            return {
+                'status': response.status_code,
+                'reason': response.reason,
+                'content_type': response.headers.get('Content-Type'),
+                'location': response.headers.get('Location'),
+                **encode_body(response.content)
+            }
+
+        key = '{} {}'.format(request.method, self._label or request.url)
+        result = self._cassette.exchange('http', key, _perform)
+        return _build_response(request, result)
+
+    def close(self):
+        self._adapter.close()
+
+
+def _build_response(request, result: dict):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    response = requests.Response()
+    response.status_code = result['status']
+    response.reason = result['reason']
+    response.headers = CaseInsensitiveDict()
+    if result['content_type']:
+        response.headers['Content-Type'] = result['content_type']
+    if result.get('location'):
+        # Keeps redirects (e.g. arXiv PDF links) working on replay
+        response.headers['Location'] = result['location']
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = decode_body(result)
+    response._content_consumed = True
+    response.url = request.url
+    response.request = request
+    return response
+
+
+def encode_body(body: bytes) -> dict:
+    """
+    Store UTF-8 bodies (Atom feeds, JSON) as text, which gzip compresses far better than base64
+    """
+    try:
+        return {'text': body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'body': base64.b64encode(body).decode('ascii')}
+
+
+def decode_body(result: dict) -> bytes:
+    if 'text' in result:
+        return result['text'].encode('utf-8')
+    return base64.b64decode(result['body'])
+
+
+def request_digest(payload: dict) -> str:
+    """
+    Stable digest of a JSON-serializable request payload
+    """
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def active_cassette() -> Optional[Cassette]:
+    return _active_cassette
+
+
+@contextlib.contextmanager
+def use_cassette(cassette: Cassette):
+    """
+    Activate `cassette` for the duration of the block; a recording is saved even if the run fails
+    """
+    global _active_cassette
+    _active_cassette = cassette
+    failed = True
+    try:
+        yield cassette
+        failed = False
+    finally:
+        _active_cassette = None
+        # Do not hide the exception the run failed with behind a replay miss
+        cassette.close(check_misses=not failed)
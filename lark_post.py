@@ -5,7 +5,7 @@ HTTP POST request to Lark Webhook API
 import json
 import datetime
 import warnings
-import requests
+from cassette import active_cassette
 
 warnings.filterwarnings('ignore')
 
@@ -18,13 +18,15 @@ def _chunk_papers(papers, batch_size):
         yield offset, papers[offset:offset + batch_size]
 
 
-def _build_pdf_url(arxiv_url: str) -> str:
-    if not arxiv_url:
-        return arxiv_url
-    return arxiv_url.replace('/abs/', '/pdf/', 1)
+def post_to_lark_webhook(tag: str, papers: list, config: dict):
+    import requests
 
+    session = requests.Session()
+    cassette = active_cassette()
+    if cassette is not None:
+        # The webhook URL carries the bot's secret token, so it is kept out of the cassette
+        cassette.mount(session, label='webhook')
 
-def post_to_lark_webhook(tag: str, papers: list, config: dict):
     headers = {
         'Content-Type': 'application/json'
     }
@@ -38,27 +40,9 @@ def post_to_lark_webhook(tag: str, papers: list, config: dict):
     total_batches = (len(papers) + batch_size - 1) // batch_size
 
     for batch_index, (offset, chunk) in enumerate(_chunk_papers(papers, batch_size), start=1):
-        table_rows = []
-        for i, paper in enumerate(chunk):
-            table_rows.append({
-                "index": offset + i + 1,
-                "title": paper['title'],
-                "published": paper['published'],
-                "url": f"[{paper['url']}]({paper['url']})"
-            })
-        paper_list = [
-            {
-                "counter": offset + i + 1,
-                "title": paper['title'],
-                "zh_title": paper.get('zh_title', None),
-                "abstract": paper['abstract'],
-                "zh_abstract": paper.get('zh_abstract', None),
-                "url": paper['url'],
-                "pdf_url": _build_pdf_url(paper['url']),
-                "published": paper['published']
-            }
-            for i, paper in enumerate(chunk)
-        ]
+        # Card rows are rendered per batch straight from the paper records
+        table_rows = [paper.table_row(offset + i + 1) for i, paper in enumerate(chunk)]
+        paper_list = [paper.card_item(offset + i + 1) for i, paper in enumerate(chunk)]
 
         card_data = {
             "type": "template",
@@ -82,7 +66,7 @@ def post_to_lark_webhook(tag: str, papers: list, config: dict):
             "card": card_data
         }
 
-        response = requests.post(config['webhook_url'], headers=headers, data=json.dumps(data))
+        response = session.post(config['webhook_url'], headers=headers, data=json.dumps(data))
 
         if response.status_code == 200:
             print("Request successful (batch {}/{})".format(batch_index, total_batches))
@@ -94,25 +78,25 @@ def post_to_lark_webhook(tag: str, papers: list, config: dict):
 
 
 if __name__ == '__main__':
+    from paper import Paper
+
     papers = [
-        {
-            'title': 'Title 1',
-            'id': '1234567890',
-            'abstract': 'Abstract 1',
-            'url': 'https://arxiv.org/abs/1234567890',
-            'published': '2021-01-01',
-            'zh_abstract': None,
-            'zh_title': None
-        },
-        {
-            'title': 'Title 2',
-            'id': '2345678901',
-            'abstract': 'Abstract 2',
-            'url': 'https://arxiv.org/abs/2345678901',
-            'published': '2021-01-02',
-            'zh_abstract': '中文摘要 2',
-            'zh_title': '中文标题 2'
-        }
+        Paper(
+            title='Title 1',
+            id='1234567890',
+            abstract='Abstract 1',
+            url='https://arxiv.org/abs/1234567890',
+            published='2021-01-01'
+        ),
+        Paper(
+            title='Title 2',
+            id='2345678901',
+            abstract='Abstract 2',
+            url='https://arxiv.org/abs/2345678901',
+            published='2021-01-02',
+            zh_abstract='中文摘要 2',
+            zh_title='中文标题 2'
+        )
     ]
     from utils import load_config
     config = load_config()
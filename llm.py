@@ -3,25 +3,39 @@ LLM Utilities
 """
 
 import re
+from typing import Optional
+from llm_scheduler import PRIORITY_FILTERING, PRIORITY_TRANSLATION
+from paper import Paper
 from utils import get_llm_response
 
+# The prompts below are sent as system messages and only the paper text follows in the user message,
+# so that providers with prefix caching can reuse the shared instructions across papers.
+PAPER_MATCH_SYSTEM_PROMPT = '你是一个专业的学术论文筛选助手。你的任务是判断用户给出的论文是否符合我正在寻找的研究内容。\n\n我正在寻找的研究内容(paper_to_hunt)：\n{paper_to_hunt}\n\n---\n\n用户会给出一篇论文的标题和摘要，有时还会附上论文首页的文本（如作者单位和引言）。请分析这篇论文的内容是否与我寻找的研究内容相符。在分析时，请考虑：\n1. 研究主题的相关性\n2. 论文的关键概念与我的研究描述的匹配程度\n\n基于你的分析，如果这篇论文符合我要找的研究内容，请只回答"Yes"；如果不符合，请只回答"No"。'
 
-def is_paper_match(paper: dict, paper_to_hunt: str, config: dict) -> bool:
+TRANSLATE_ABSTRACT_SYSTEM_PROMPT = '请将用户给出的学术论文摘要翻译为中文。\n\n**注意**：\n- 中文语境中常用的英文学术术语可以保留英文原文，如：自然语言处理中的 Transformer 可以保留英文。\n- 其他关键的学术术语可以中英文对照，如：后门攻击(Backdoor Attack)。\n- 直接给出翻译结果，不需要进行解释，不需要任何其他内容。'
+
+TRANSLATE_TITLE_SYSTEM_PROMPT = '请将用户给出的学术论文标题翻译为中文。\n\n**要求**：\n- 保留常见的英文学术缩写（如 LLM、NLP 等）。\n- 保持语义准确并符合中文学术表达习惯。\n- 直接返回翻译后的标题，不需要任何说明或额外内容。'
+
+
+def is_paper_match(paper: Paper, paper_to_hunt: str, config: dict) -> Optional[bool]:
     """
     Check if the paper matches `paper_to_hunt` description using LLM
     :param paper: the paper to check
     :param paper_to_hunt: the prompt describing the paper to hunt for
     :param config: the configuration of LLM Server
-    :return: True if the paper matches or LLM Service fails, False otherwise
+    :return: True if the paper matches, False if not, None if the LLM could not judge it (service error or budget exhausted)
     """
-    paper_title = paper['title']
-    paper_abstract = paper['abstract']
-    prompt = f'你是一个专业的学术论文筛选助手。你的任务是判断给定的论文是否符合我正在寻找的研究内容。\n\n请仔细阅读以下论文的标题和摘要：\n标题：{paper_title}\n摘要：{paper_abstract}\n\n我正在寻找的研究内容(paper_to_hunt)：\n{paper_to_hunt}\n\n---\n\n请分析这篇论文的内容是否与我寻找的研究内容相符。在分析时，请考虑：\n1. 研究主题的相关性\n2. 论文的关键概念与我的研究描述的匹配程度\n\n基于你的分析，如果这篇论文符合我要找的研究内容，请只回答"Yes"；如果不符合，请只回答"No"。'
-    response = get_llm_response(prompt, config)
+    paper_title = paper.title
+    paper_abstract = paper.abstract
+    # `paper_to_hunt` is the same for every paper, so it belongs to the cacheable prefix
+    system_prompt = PAPER_MATCH_SYSTEM_PROMPT.format(paper_to_hunt=paper_to_hunt)
+    prompt = f'标题：{paper_title}\n摘要：{paper_abstract}'
+    if paper.pdf_text:
+        prompt += f'\n论文首页：{paper.pdf_text}'
+    response = get_llm_response(prompt, config, system_prompt=system_prompt, priority=PRIORITY_FILTERING)
     if not response:
-        # LLM Service Error, assuming the paper matches
-        print('LLM Service Error for paper: {}. Assuming it matches.'.format(paper_title))
-        return True
+        print('LLM could not judge paper: {}'.format(paper_title))
+        return None
 
     # Filter out the thinking process wrapped between <think> and </think> (if any)
     response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
@@ -50,8 +64,7 @@ def translate_abstract(abstract: str, config: dict):
     :param config: the configuration of LLM Server
     :return: the translated abstract or None if failed
     """
-    prompt = f'请将下面的学术论文摘要翻译为中文：\n{abstract}\n\n**注意**：\n- 中文语境中常用的英文学术术语可以保留英文原文，如：自然语言处理中的 Transformer 可以保留英文。\n- 其他关键的学术术语可以中英文对照，如：后门攻击(Backdoor Attack)。\n- 直接给出翻译结果，不需要进行解释，不需要任何其他内容。'
-    translated_text = get_llm_response(prompt, config)
+    translated_text = get_llm_response(abstract, config, system_prompt=TRANSLATE_ABSTRACT_SYSTEM_PROMPT, priority=PRIORITY_TRANSLATION)
     if not translated_text:
         return None
     # Filter out the thinking process wrapped between <think> and </think> (if any)
@@ -66,8 +79,7 @@ def translate_title(title: str, config: dict):
     :param config: the configuration of LLM Server
     :return: the translated title or None if failed
     """
-    prompt = f'请将下面的学术论文标题翻译为中文：\n{title}\n\n**要求**：\n- 保留常见的英文学术缩写（如 LLM、NLP 等）。\n- 保持语义准确并符合中文学术表达习惯。\n- 直接返回翻译后的标题，不需要任何说明或额外内容。'
-    translated_text = get_llm_response(prompt, config)
+    translated_text = get_llm_response(title, config, system_prompt=TRANSLATE_TITLE_SYSTEM_PROMPT, priority=PRIORITY_TRANSLATION)
     if not translated_text:
         return None
     translated_text = re.sub(r'<think>.*?</think>', '', translated_text, flags=re.DOTALL)
@@ -0,0 +1,173 @@
+"""
+LLM Scheduler: shared budget, retries and adaptive concurrency for all LLM calls of a run
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from cassette import active_cassette
+
+# Lower values are served first and keep access to the budget reserved for filtering
+PRIORITY_FILTERING = 0
+PRIORITY_TRANSLATION = 1
+
+
+class LLMScheduler:
+    """
+    Gate for LLM requests that
+    - enforces per-run request and token budgets (`llm_max_requests`, `llm_max_tokens`, 0 means unlimited),
+      keeping the last `llm_filtering_reserve` fraction of them for filtering calls while any are in progress;
+    - retries transient errors (rate limits, timeouts, 5xx) with jittered exponential backoff;
+    - sizes concurrency additively from latencies under `llm_target_latency_seconds` and halves it on 429s.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.reset({})
+
+    def reset(self, config: dict):
+        with self._condition:
+            self.max_requests = config.get('llm_max_requests') or 0
+            self.max_tokens = config.get('llm_max_tokens') or 0
+            self.filtering_reserve = config.get('llm_filtering_reserve', 0.2)
+            self.max_concurrency = max(1, config.get('llm_max_concurrency', 4))
+            self.max_retries = config.get('llm_max_retries', 4)
+            self.target_latency = config.get('llm_target_latency_seconds', 30)
+            self.backoff_base = config.get('llm_backoff_base_seconds', 1.0)
+            self.backoff_max = config.get('llm_backoff_max_seconds', 60.0)
+            self.concurrency = 1.0
+            self.in_flight = 0
+            self.waiting = {}
+            self.active = {}
+            self.requests = 0
+            self.tokens = 0
+            self.retries = 0
+            self.rate_limited = 0
+            self.denied = 0
+            self.failed = 0
+
+    def _within_budget(self, priority: int) -> bool:
+        # While filtering calls are in progress, calls below filtering priority may only use the part of the
+        # budget not reserved for filtering; once filtering is done they may use what it left
+        filtering = any(count for p, count in self.active.items() if p <= PRIORITY_FILTERING)
+        share = 1.0 - self.filtering_reserve if priority > PRIORITY_FILTERING and filtering else 1.0
+        if self.max_requests and self.requests >= self.max_requests * share:
+            return False
+        if self.max_tokens and self.tokens >= self.max_tokens * share:
+            return False
+        return True
+
+    def _acquire(self, priority: int, within_budget: Optional[bool] = None) -> bool:
+        """
+        Wait for a request slot, serving higher priorities first
+        :param within_budget: a budget decision to apply instead of checking the budget, when replaying
+        :return: False if the budget does not allow the request
+        """
+        with self._condition:
+            self.waiting[priority] = self.waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    if not (self._within_budget(priority) if within_budget is None else within_budget):
+                        self.denied += 1
+                        return False
+                    higher_waiting = any(count for p, count in self.waiting.items() if p < priority)
+                    if self.in_flight < int(self.concurrency) and not higher_waiting:
+                        break
+                    self._condition.wait()
+                self.in_flight += 1
+                self.requests += 1
+                return True
+            finally:
+                self.waiting[priority] -= 1
+                # Lower priorities may have been held back by this waiter
+                self._condition.notify_all()
+
+    def _release(self, result: dict, latency: float):
+        with self._condition:
+            self.in_flight -= 1
+            usage = result.get('usage') or {}
+            self.tokens += (usage.get('prompt_tokens') or 0) + (usage.get('completion_tokens') or 0)
+            if result.get('status') == 429:
+                self.rate_limited += 1
+                self.concurrency = max(1.0, self.concurrency / 2)
+            elif 'error' not in result and latency <= self.target_latency:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+            elif latency > self.target_latency:
+                self.concurrency = max(1.0, self.concurrency - 1)
+            self._condition.notify_all()
+
+    def _backoff(self, retry: int):
+        cassette = active_cassette()
+        if cassette is not None and cassette.replaying:
+            return
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry)))
+
+    def call(self, attempt: Callable[[], dict], priority: int = PRIORITY_FILTERING,
+             exchange_key: Optional[str] = None) -> dict:
+        """
+        Run `attempt` under the budget and concurrency limits, retrying transient errors
+        :param attempt: performs one request and returns a dict with `content` and `usage`, or `error`,
+            `status` and `transient`
+        :param priority: `PRIORITY_FILTERING` or `PRIORITY_TRANSLATION`
+        :param exchange_key: the `chat` key under which attempts and budget denials are recorded to, or replayed
+            from, the active cassette
+        :return: the result of the last attempt, or an error result with `denied` set if the budget ran out
+        """
+        with self._condition:
+            self.active[priority] = self.active.get(priority, 0) + 1
+        try:
+            return self._call(attempt, priority, exchange_key)
+        finally:
+            with self._condition:
+                self.active[priority] -= 1
+                self._condition.notify_all()
+
+    def _call(self, attempt: Callable[[], dict], priority: int, exchange_key: Optional[str]) -> dict:
+        cassette = active_cassette() if exchange_key is not None else None
+        result = {}
+        for retry in range(self.max_retries + 1):
+            replayed = None
+            if cassette is not None and cassette.replaying:
+                # Racing threads may spend the budget on other requests than when recording,
+                # so the recorded budget decision is replayed instead of taken again
+                replayed = cassette.exchange('chat', exchange_key, None)
+                admitted = self._acquire(priority, within_budget=not replayed.get('denied'))
+            else:
+                admitted = self._acquire(priority)
+            if not admitted:
+                result = {'error': 'LLM budget exhausted', 'status': None, 'transient': False, 'denied': True}
+                if cassette is not None and not cassette.replaying:
+                    cassette.exchange('chat', exchange_key, lambda: result)
+                return result
+            started = time.monotonic()
+            result = {'error': 'LLM request aborted', 'status': None, 'transient': False}
+            try:
+                if replayed is not None:
+                    result = replayed
+                elif cassette is not None:
+                    result = cassette.exchange('chat', exchange_key, attempt)
+                else:
+                    result = attempt()
+            finally:
+                self._release(result, time.monotonic() - started)
+            if 'error' not in result:
+                return result
+            if not result.get('transient') or retry == self.max_retries:
+                break
+            with self._condition:
+                self.retries += 1
+            self._backoff(retry)
+        with self._condition:
+            self.failed += 1
+        return result
+
+    def summary(self) -> str:
+        return 'LLM scheduler: {} requests, {} retries, {} rate limited, {} failed, {} denied by budget, final concurrency {}'.format(
+            self.requests, self.retries, self.rate_limited, self.failed, self.denied, int(self.concurrency)
+        )
+
+
+# Scheduler shared by all LLM calls in the current run
+llm_scheduler = LLMScheduler()
@@ -7,22 +7,34 @@ import datetime
 import os
 import warnings
 
-from arxiv_paper import get_latest_papers, deduplicate_papers_across_categories, filter_papers_by_keyword, filter_papers_using_llm, deduplicate_papers, prepend_to_json_file, translate_abstracts
+from arxiv_paper import get_latest_papers, deduplicate_papers_across_categories, filter_papers_by_keyword, refilter_papers_by_keyword, filter_papers_using_llm, load_paper_ids, deduplicate_papers, prepend_to_json_file, translate_abstracts
+from cassette import Cassette, active_cassette, use_cassette
 from lark_post import post_to_lark_webhook
-from utils import load_config
+from llm_scheduler import llm_scheduler
+from utils import load_config, llm_usage
 
 warnings.filterwarnings('ignore')
 
 DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.yaml')
 DEFAULT_SCHEDULE_TIME = '15:40'
+PAPER_FILE = os.path.join(os.path.dirname(__file__), 'papers.json')
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Fetch latest arXiv papers and post to Lark webhook.')
     parser.add_argument('-c', '--config', default=DEFAULT_CONFIG_PATH, help='Path to configuration YAML file.')
-    parser.add_argument('--mode', choices=['once', 'periodic'], default='periodic', help='Execution mode: run once immediately or keep a daily schedule.')
+    parser.add_argument('--mode', choices=['once', 'periodic', 'refilter'], default='periodic', help='Execution mode: run once immediately, keep a daily schedule, or re-score stored papers against `keyword_list`.')
     parser.add_argument('--schedule-time', default=DEFAULT_SCHEDULE_TIME, help='Daily trigger time (HH:MM, 24-hour format) when mode is periodic.')
-    return parser.parse_args()
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes when mode is refilter (defaults to the number of CPUs).')
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', metavar='CASSETTE', help='Record all arXiv, LLM and webhook traffic of the run to a cassette file (mode once only).')
+    cassette_group.add_argument('--replay', metavar='CASSETTE', help='Replay a recorded cassette offline instead of contacting any service (mode once only).')
+    args = parser.parse_args()
+    if (args.record or args.replay) and args.mode != 'once':
+        parser.error('--record and --replay require --mode once')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    return args
 
 
 def task(config: dict):
@@ -36,7 +48,7 @@ def task(config: dict):
     use_llm_for_translation = config['use_llm_for_translation']
     max_results_per_category = config.get('max_results_per_category', 100)
 
-    paper_file = os.path.join(os.path.dirname(__file__), 'papers.json')
+    paper_file = PAPER_FILE
     paper_to_hunt = None
     if use_llm_for_filtering:
         with open(os.path.join(os.path.dirname(__file__), 'paper_to_hunt.md'), 'r', encoding='utf-8') as file:
@@ -44,6 +56,8 @@ def task(config: dict):
 
     today_date = datetime.date.today().strftime('%Y-%m-%d')
     print('Task: {}'.format(today_date))
+    llm_usage.reset()
+    llm_scheduler.reset(config)
 
     papers = []
     for category in category_list:
@@ -57,18 +71,39 @@ def task(config: dict):
         papers = filter_papers_by_keyword(papers, keyword_list)
     print('Filtered papers by Keyword: {}'.format(len(papers)))
 
+    if use_llm_for_filtering and paper_to_hunt and config.get('use_pdf_enrichment', False):
+        from pdf_enrich import enrich_papers_with_pdf
+
+        papers = enrich_papers_with_pdf(papers, config)
+        print('Enriched papers with PDF text: {}'.format(sum(1 for paper in papers if paper.pdf_text)))
+
     if use_llm_for_filtering and paper_to_hunt:
         papers = filter_papers_using_llm(papers, paper_to_hunt, config)
         print('Filtered papers by LLM: {}'.format(len(papers)))
 
-    papers = deduplicate_papers(papers, paper_file)
+    cassette = active_cassette()
+    if cassette is not None and cassette.replaying:
+        # Deduplicate against the history as it was when recording, so that replay is deterministic
+        recorded_ids = set(cassette.history_ids)
+        papers = [paper for paper in papers if paper.id not in recorded_ids]
+    else:
+        if cassette is not None:
+            # Only the history entries that affect this run are kept in the cassette
+            history_ids = set(load_paper_ids(paper_file))
+            cassette.history_ids = [paper.id for paper in papers if paper.id in history_ids]
+        papers = deduplicate_papers(papers, paper_file)
     print('Deduplicated papers: {}'.format(len(papers)))
 
     if use_llm_for_translation:
         papers = translate_abstracts(papers, config)
         print('Translated Abstracts into Chinese')
 
-    prepend_to_json_file(paper_file, papers)
+    if llm_scheduler.requests or llm_scheduler.denied:
+        print(llm_scheduler.summary())
+        print(llm_usage.summary(config))
+
+    if cassette is None or not cassette.replaying:
+        prepend_to_json_file(paper_file, papers)
 
     post_to_lark_webhook(tag, papers, config)
 
@@ -79,6 +114,19 @@ def main():
         from main_periodic import run_periodic
 
         run_periodic(config_path=args.config, schedule_time=args.schedule_time)
+    elif args.mode == 'refilter':
+        config = load_config(args.config)
+        if not config['keyword_list']:
+            print('No `keyword_list` configured; nothing to refilter.')
+            return
+        match_counts = refilter_papers_by_keyword(PAPER_FILE, config['keyword_list'], workers=args.workers)
+        for keyword, count in match_counts.items():
+            print('Stored papers matching `{}`: {}'.format(keyword, count))
+    elif args.record or args.replay:
+        config = load_config(args.config)
+        cassette = Cassette(args.record or args.replay, mode='record' if args.record else 'replay')
+        with use_cassette(cassette):
+            task(config)
     else:
         config = load_config(args.config)
         task(config)
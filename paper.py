@@ -0,0 +1,63 @@
+"""
+Paper Record
+"""
+
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+
+@dataclass(slots=True)
+class Paper:
+    """
+    A compact paper record shared by fetching, filtering, translation and posting.
+    Card rows are rendered on demand from the record instead of copying it up front.
+    """
+    title: str
+    id: str
+    abstract: str
+    url: str
+    published: str
+    zh_abstract: Optional[str] = None
+    zh_title: Optional[str] = None
+    # Keyword rules from `keyword_list` that the paper matched
+    keyword_matches: Optional[list] = None
+    # First-page text of the PDF, only used as extra context for LLM filtering and not persisted
+    pdf_text: Optional[str] = field(default=None, metadata={'persist': False})
+
+    @property
+    def pdf_url(self) -> str:
+        if not self.url:
+            return self.url
+        return self.url.replace('/abs/', '/pdf/', 1)
+
+    def to_dict(self) -> dict:
+        return {
+            field.name: getattr(self, field.name)
+            for field in fields(self) if field.metadata.get('persist', True)
+        }
+
+    def table_row(self, index: int) -> dict:
+        """
+        Render the paper as a row of the card summary table
+        """
+        return {
+            "index": index,
+            "title": self.title,
+            "published": self.published,
+            "url": f"[{self.url}]({self.url})"
+        }
+
+    def card_item(self, counter: int) -> dict:
+        """
+        Render the paper as an entry of the card paper list
+        """
+        return {
+            "counter": counter,
+            "title": self.title,
+            "zh_title": self.zh_title,
+            "abstract": self.abstract,
+            "zh_abstract": self.zh_abstract,
+            "url": self.url,
+            "pdf_url": self.pdf_url,
+            "published": self.published
+        }
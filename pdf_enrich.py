@@ -0,0 +1,243 @@
+"""
+PDF Enrichment: download PDFs of filtered papers and extract first-page text for LLM filtering
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from cassette import Cassette, active_cassette, decode_body, encode_body
+from paper import Paper
+
+warnings.filterwarnings('ignore')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'pdf_cache')
+CHUNK_SIZE = 64 * 1024
+
+
+class PdfCache:
+    """
+    Content-addressed on-disk cache of PDFs with least-recently-used eviction.
+
+    PDFs are stored under `objects/` named by their SHA-256 digest and `index.json` maps URLs to digests.
+    The modification time of an object is refreshed on every hit and used as its last access time.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._objects_dir = os.path.join(cache_dir, 'objects')
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        os.makedirs(self._objects_dir, exist_ok=True)
+        self._index = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._objects_dir, digest[:2], digest + '.pdf')
+
+    def get(self, url: str) -> Optional[bytes]:
+        with self._lock:
+            digest = self._index.get(url)
+            if digest is None:
+                return None
+            path = self._object_path(digest)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                del self._index[url]
+                return None
+            os.utime(path)
+            return data
+
+    def put(self, url: str, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._index[url] = digest
+            self._evict()
+        return digest
+
+    def _evict(self):
+        """
+        Remove least recently used objects until the cache fits in `max_bytes`
+        """
+        objects = []
+        total_bytes = 0
+        for root, _, files in os.walk(self._objects_dir):
+            for name in files:
+                if not name.endswith('.pdf'):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                objects.append((stat.st_mtime, stat.st_size, path, name[:-len('.pdf')]))
+                total_bytes += stat.st_size
+        if total_bytes <= self.max_bytes:
+            return
+
+        evicted = set()
+        for _, size, path, digest in sorted(objects):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            evicted.add(digest)
+            total_bytes -= size
+        self._index = {url: digest for url, digest in self._index.items() if digest not in evicted}
+
+    def save(self):
+        with self._lock:
+            tmp_path = self._index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self._index_path)
+
+
+class _ByteBudget:
+    """
+    Total number of bytes the download pool may fetch in one run
+    """
+
+    def __init__(self, max_bytes: int):
+        self.remaining = max_bytes
+        self._lock = threading.Lock()
+
+    def consume(self, num_bytes: int) -> bool:
+        with self._lock:
+            if num_bytes > self.remaining:
+                self.remaining = 0
+                return False
+            self.remaining -= num_bytes
+            return True
+
+
+def _download_pdf(session, url: str, max_file_bytes: int, budget: _ByteBudget, timeout: float) -> Optional[bytes]:
+    """
+    Stream a PDF, giving up once it exceeds `max_file_bytes` or the run's byte budget
+    """
+    try:
+        with session.get(url, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                print('PDF download failed ({}): status code {}'.format(url, response.status_code))
+                return None
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > max_file_bytes:
+                print('Skipping PDF larger than {} bytes: {}'.format(max_file_bytes, url))
+                return None
+            buffer = io.BytesIO()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if buffer.tell() + len(chunk) > max_file_bytes:
+                    print('Skipping PDF larger than {} bytes: {}'.format(max_file_bytes, url))
+                    return None
+                if not budget.consume(len(chunk)):
+                    print('PDF download budget exhausted at: {}'.format(url))
+                    return None
+                buffer.write(chunk)
+            return buffer.getvalue()
+    except Exception as exc:
+        print('PDF download failed ({}): {}'.format(url, exc))
+        return None
+
+
+def _download_pdf_through_cassette(cassette: Cassette, get_session, url: str, max_file_bytes: int, budget: _ByteBudget,
+                                   timeout: float) -> Optional[bytes]:
+    """
+    Record the outcome of a limited download, or replay it, so that replay never touches the network
+    """
+    def _perform():
+        data = _download_pdf(get_session(), url, max_file_bytes, budget, timeout)
+        return encode_body(data) if data is not None else {'skipped': True}
+
+    result = cassette.exchange('pdf', url, _perform)
+    return None if result.get('skipped') else decode_body(result)
+
+
+def extract_first_page_text(data: bytes, max_chars: int) -> Optional[str]:
+    """
+    Extract the text of the first page of a PDF (title block, affiliations, start of the introduction)
+    :param data: the PDF content
+    :param max_chars: the maximum number of characters to keep
+    :return: the whitespace-normalized text or None if extraction failed
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        print('pypdf is not installed; skipping PDF text extraction.')
+        return None
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        if not reader.pages:
+            return None
+        text = reader.pages[0].extract_text() or ''
+    except Exception as exc:
+        print('PDF text extraction failed: {}'.format(exc))
+        return None
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text[:max_chars] if text else None
+
+
+def enrich_papers_with_pdf(papers: list, config: dict, cache: Optional[PdfCache] = None):
+    """
+    Download the PDFs of the given papers through a bounded pool and attach their first-page text
+    :param papers: a list of `Paper` records
+    :param config: the configuration, `pdf_*` fields control the pool, the byte budget and the cache
+    :param cache: the PDF cache to use, built from the configuration if omitted; not used under a cassette
+    :return: the papers, with `pdf_text` set where a PDF could be fetched and parsed
+    """
+    import requests
+
+    cassette = active_cassette()
+    if cache is None and cassette is None:
+        cache = PdfCache(
+            config.get('pdf_cache_dir') or DEFAULT_CACHE_DIR,
+            int(config.get('pdf_cache_max_mb', 500) * 2 ** 20)
+        )
+    max_workers = config.get('pdf_max_workers', 4)
+    max_file_bytes = int(config.get('pdf_max_file_mb', 20) * 2 ** 20)
+    budget = _ByteBudget(int(config.get('pdf_download_budget_mb', 200) * 2 ** 20))
+    timeout = config.get('pdf_timeout_seconds', 60)
+    max_chars = config.get('pdf_first_page_chars', 2000)
+
+    # `requests.Session` is not thread-safe, so every worker keeps its own
+    local = threading.local()
+
+    def _get_session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def _enrich(paper: Paper):
+        url = paper.pdf_url
+        if cassette is not None:
+            # The cache is bypassed so that what a replay sees depends on the cassette alone
+            data = _download_pdf_through_cassette(cassette, _get_session, url, max_file_bytes, budget, timeout)
+        else:
+            data = cache.get(url)
+            if data is None:
+                data = _download_pdf(_get_session(), url, max_file_bytes, budget, timeout)
+                if data is not None:
+                    cache.put(url, data)
+        if data is not None:
+            paper.pdf_text = extract_first_page_text(data, max_chars)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_enrich, papers))
+    if cache is not None:
+        cache.save()
+    return papers
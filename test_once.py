@@ -8,7 +8,8 @@ import os
 import warnings
 from arxiv_paper import get_latest_papers, deduplicate_papers_across_categories, filter_papers_by_keyword, filter_papers_using_llm, deduplicate_papers, prepend_to_json_file, translate_abstracts
 from lark_post import post_to_lark_webhook
-from utils import load_config
+from llm_scheduler import llm_scheduler
+from utils import load_config, llm_usage
 
 warnings.filterwarnings('ignore')
 
@@ -40,6 +41,8 @@ def task(config: dict):
 
     today_date = datetime.date.today().strftime('%Y-%m-%d')
     print('Task: {}'.format(today_date))
+    llm_usage.reset()
+    llm_scheduler.reset(config)
 
     papers = []
     for category in category_list:
@@ -65,6 +68,10 @@ def task(config: dict):
         papers = translate_abstracts(papers, config)
         print('Translated Abstracts into Chinese')
 
+    if llm_scheduler.requests or llm_scheduler.denied:
+        print(llm_scheduler.summary())
+        print(llm_usage.summary(config))
+
     prepend_to_json_file(paper_file, papers)
 
     # Post to Lark Webhook
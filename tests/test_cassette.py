@@ -0,0 +1,168 @@
+"""
+Recording a full run against local stand-ins for arXiv, the LLM server and the Lark webhook, then replaying it offline
+"""
+
+import gzip
+import http.server
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+arxiv = pytest.importorskip('arxiv')
+pytest.importorskip('openai')
+
+import main  # noqa: E402
+import utils  # noqa: E402
+from cassette import Cassette, use_cassette  # noqa: E402
+
+WEBHOOK_PATH = '/open-apis/bot/v2/hook/secret-token'
+
+
+def _make_feed(papers, total_results) -> bytes:
+    entries = ''.join(
+        '<entry><id>http://arxiv.org/abs/{id}v1</id><updated>2025-01-01T00:00:00Z</updated>'
+        '<published>2025-01-01T00:00:00Z</published><title>{title}</title><summary>{abstract}</summary>'
+        '<author><name>A. Author</name></author>'
+        '<link href="http://arxiv.org/abs/{id}v1" rel="alternate" type="text/html"/>'
+        '<arxiv:primary_category term="cs.CL"/><category term="cs.CL"/></entry>'.format(**paper)
+        for paper in papers
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" '
+        'xmlns:arxiv="http://arxiv.org/schemas/atom">'
+        '<opensearch:totalResults>{}</opensearch:totalResults><opensearch:startIndex>0</opensearch:startIndex>'
+        '<opensearch:itemsPerPage>{}</opensearch:itemsPerPage>{}</feed>'.format(total_results, len(papers), entries)
+    ).encode('utf-8')
+
+
+FEEDS = {
+    'cs.CL': _make_feed([
+        {'id': '2501.00001', 'title': 'Molecule design with large language models', 'abstract': 'A molecule study.'},
+        {'id': '2501.00002', 'title': 'Parsing news', 'abstract': 'Nothing about chemistry.'},
+        {'id': '2501.00003', 'title': 'Molecule generation with a language model', 'abstract': 'Another molecule study.'},
+    ], 3),
+    # An empty total makes the feedparser-based arxiv client fail, so this page goes through the fallback parser
+    'q-bio.BM': _make_feed([
+        {'id': '2501.00004', 'title': 'Molecule docking with large language models', 'abstract': 'A docking study.'},
+    ], ''),
+}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        category = next((name for name in FEEDS if 'cat%3A{}&'.format(name) in self.path), None)
+        body = FEEDS.get(category, _make_feed([], 0))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/atom+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.hits.append(self.path)
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = b'{"code":0,"msg":"success"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Client:
+    """
+    Stand-in for the OpenAI client: matches papers mentioning "large language models" and echoes translations
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, **kwargs):
+        self.calls += 1
+        system_prompt, prompt = messages[0]['content'], messages[-1]['content']
+        if system_prompt.startswith('请将'):
+            content = '译：{}'.format(prompt)
+        else:
+            content = 'Yes' if 'large language models' in prompt else 'No'
+        usage = SimpleNamespace(model_dump=lambda: {'prompt_tokens': 10, 'completion_tokens': 2})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class _OfflineClient:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        raise AssertionError('Replay must not call the LLM server')
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.hits = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_replay_reproduces_a_recorded_run_offline(server, tmp_path, monkeypatch, capsys):
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+    monkeypatch.setattr(arxiv.Client, 'query_url_format', base_url + '/api/query?{}')
+    paper_file = tmp_path / 'papers.json'
+    # A paper already in the history is deduplicated away, and must stay so on replay
+    paper_file.write_text(json.dumps([{'id': '2501.00003'}]), encoding='utf-8')
+    monkeypatch.setattr(main, 'PAPER_FILE', str(paper_file))
+
+    posted = []
+
+    def _post_to_lark_webhook(tag, papers, config):
+        posted.append([paper.to_dict() for paper in papers])
+        post_to_lark_webhook(tag, papers, config)
+
+    post_to_lark_webhook = main.post_to_lark_webhook
+    monkeypatch.setattr(main, 'post_to_lark_webhook', _post_to_lark_webhook)
+
+    config = {
+        'tag': 'test', 'category_list': ['cs.CL', 'q-bio.BM'], 'keyword_list': ['molecule'],
+        'max_results_per_category': 10, 'use_llm_for_filtering': True, 'use_llm_for_translation': True,
+        'model': 'test-model', 'base_url': 'http://127.0.0.1:9/v1', 'api_key': 'test',
+        'webhook_url': base_url + WEBHOOK_PATH, 'template_id': 'template', 'template_version_name': '1.0.0'
+    }
+    cassette_path = tmp_path / 'run.cassette.json.gz'
+
+    client = _Client()
+    monkeypatch.setattr(utils, '_get_openai_client', lambda base_url, api_key: client)
+    with use_cassette(Cassette(str(cassette_path), 'record')):
+        main.task(config)
+    recorded_output = capsys.readouterr().out
+    assert client.calls > 0
+    assert WEBHOOK_PATH in server.hits
+    if hasattr(arxiv.Result, '_from_feed_entry'):
+        # Only the feedparser-based client chokes on the empty total; later clients parse it themselves
+        assert 'q-bio.BM' in recorded_output and 'Retrying with fallback parser' in recorded_output
+    with gzip.open(cassette_path, 'rt', encoding='utf-8') as f:
+        assert 'secret-token' not in f.read()
+
+    history = paper_file.read_text(encoding='utf-8')
+    server.shutdown()
+    server.hits.clear()
+    monkeypatch.setattr(utils, '_get_openai_client', lambda base_url, api_key: _OfflineClient())
+    with use_cassette(Cassette(str(cassette_path), 'replay')):
+        main.task(config)
+
+    assert server.hits == []
+    assert paper_file.read_text(encoding='utf-8') == history
+    recorded, replayed = posted
+    assert [paper['id'] for paper in recorded] == ['2501.00001', '2501.00004']
+    assert replayed == recorded
+    assert recorded[0]['zh_title'] == '译：Molecule design with large language models'
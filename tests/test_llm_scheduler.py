@@ -0,0 +1,279 @@
+"""
+LLM scheduler budget handling in LLM filtering
+"""
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('openai')
+
+import utils  # noqa: E402
+from arxiv_paper import filter_papers_using_llm  # noqa: E402
+from cassette import Cassette, use_cassette  # noqa: E402
+from llm import is_paper_match  # noqa: E402
+from llm_scheduler import PRIORITY_FILTERING, PRIORITY_TRANSLATION, llm_scheduler  # noqa: E402
+from paper import Paper  # noqa: E402
+
+CONFIG = {'model': 'test-model', 'base_url': 'http://127.0.0.1:9/v1', 'api_key': 'test', 'llm_max_concurrency': 1}
+RETRY_CONFIG = dict(CONFIG, llm_max_retries=3, llm_backoff_base_seconds=0.001, llm_backoff_max_seconds=0.001)
+
+
+class _YesClient:
+    """
+    Stand-in for the OpenAI client that answers every request with "Yes"
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        message = SimpleNamespace(content='Yes')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class _StatusError(Exception):
+    """
+    An API error carrying an HTTP status, like `openai.APIStatusError`
+    """
+
+    def __init__(self, status_code: int):
+        super().__init__('HTTP {}'.format(status_code))
+        self.status_code = status_code
+
+
+class _ScriptedClient:
+    """
+    Stand-in for the OpenAI client that fails with the given HTTP statuses, then answers "Yes"
+    """
+
+    def __init__(self, statuses):
+        self.calls = 0
+        self.statuses = list(statuses)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        if self.statuses:
+            raise _StatusError(self.statuses.pop(0))
+        message = SimpleNamespace(content='Yes')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    def _install(*statuses):
+        scripted_client = _ScriptedClient(statuses)
+        monkeypatch.setattr(utils, '_get_openai_client', lambda base_url, api_key: scripted_client)
+        return scripted_client
+
+    yield _install
+    llm_scheduler.reset({})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake_client = _YesClient()
+    monkeypatch.setattr(utils, '_get_openai_client', lambda base_url, api_key: fake_client)
+    yield fake_client
+    llm_scheduler.reset({})
+
+
+def _papers(count):
+    return [Paper(title='Paper {}'.format(i), id=str(i), abstract='', url='', published='') for i in range(count)]
+
+
+def test_denied_call_is_not_a_match(client):
+    llm_scheduler.reset(dict(CONFIG, llm_max_requests=1))
+    first, second = _papers(2)
+    assert is_paper_match(first, 'anything', CONFIG) is True
+    assert is_paper_match(second, 'anything', CONFIG) is None
+    assert client.calls == 1
+    assert llm_scheduler.denied == 1
+
+
+def test_filtering_drops_papers_denied_by_budget(client):
+    config = dict(CONFIG, llm_max_requests=2)
+    llm_scheduler.reset(config)
+    results = filter_papers_using_llm(_papers(3), 'anything', config)
+    assert len(results) == 2
+    assert client.calls == 2
+    assert llm_scheduler.denied == 1
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_transient_errors_are_retried(scripted, status):
+    llm_scheduler.reset(RETRY_CONFIG)
+    client = scripted(status, status)
+    assert utils.get_llm_response('prompt', RETRY_CONFIG) == 'Yes'
+    assert client.calls == 3
+    assert llm_scheduler.retries == 2
+
+
+def test_retries_stop_at_max_retries(scripted):
+    llm_scheduler.reset(RETRY_CONFIG)
+    client = scripted(*[503] * 10)
+    assert utils.get_llm_response('prompt', RETRY_CONFIG) is None
+    assert client.calls == 4
+    assert llm_scheduler.retries == 3
+    assert llm_scheduler.failed == 1
+
+
+@pytest.mark.parametrize('status', [400, 401, 404])
+def test_client_errors_are_not_retried(scripted, status):
+    llm_scheduler.reset(RETRY_CONFIG)
+    client = scripted(status)
+    assert utils.get_llm_response('prompt', RETRY_CONFIG) is None
+    assert client.calls == 1
+    assert llm_scheduler.retries == 0
+    assert llm_scheduler.failed == 1
+
+
+def test_concurrency_grows_while_latency_is_under_target(scripted):
+    config = dict(RETRY_CONFIG, llm_max_concurrency=4, llm_target_latency_seconds=30)
+    llm_scheduler.reset(config)
+    scripted()
+    concurrencies = []
+    for _ in range(8):
+        utils.get_llm_response('prompt', config)
+        concurrencies.append(llm_scheduler.concurrency)
+    assert concurrencies == sorted(concurrencies)
+    assert concurrencies[0] == 2.0
+    assert concurrencies[-1] == 4.0
+
+
+def test_concurrency_does_not_grow_over_target_latency(scripted):
+    config = dict(RETRY_CONFIG, llm_max_concurrency=4, llm_target_latency_seconds=0)
+    llm_scheduler.reset(config)
+    scripted()
+    for _ in range(4):
+        utils.get_llm_response('prompt', config)
+    assert llm_scheduler.concurrency == 1.0
+
+
+def test_concurrency_halves_on_rate_limit(scripted):
+    config = dict(RETRY_CONFIG, llm_max_concurrency=4)
+    llm_scheduler.reset(config)
+    scripted()
+    for _ in range(8):
+        utils.get_llm_response('prompt', config)
+    assert llm_scheduler.concurrency == 4.0
+
+    scripted(429)
+    assert utils.get_llm_response('prompt', config) == 'Yes'
+    assert llm_scheduler.rate_limited == 1
+    # Halved by the 429, then grown additively by the successful retry
+    assert llm_scheduler.concurrency == 2.5
+
+
+def test_waiting_filtering_call_is_served_before_waiting_translation_call():
+    llm_scheduler.reset(dict(CONFIG, llm_max_concurrency=1))
+    started, release = threading.Event(), threading.Event()
+    served = []
+
+    def _blocking_success():
+        started.set()
+        release.wait(5)
+        return _success()
+
+    def _recording_success(name):
+        served.append(name)
+        return _success()
+
+    blocker = threading.Thread(target=llm_scheduler.call, args=(_blocking_success, PRIORITY_TRANSLATION))
+    blocker.start()
+    assert started.wait(5)
+
+    translation = threading.Thread(
+        target=llm_scheduler.call, args=(lambda: _recording_success('translation'), PRIORITY_TRANSLATION))
+    translation.start()
+    _wait_until(lambda: llm_scheduler.waiting.get(PRIORITY_TRANSLATION) == 1)
+    filtering = threading.Thread(
+        target=llm_scheduler.call, args=(lambda: _recording_success('filtering'), PRIORITY_FILTERING))
+    filtering.start()
+    _wait_until(lambda: llm_scheduler.waiting.get(PRIORITY_FILTERING) == 1)
+
+    release.set()
+    for thread in (blocker, translation, filtering):
+        thread.join(5)
+    assert served == ['filtering', 'translation']
+    llm_scheduler.reset({})
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def _success():
+    return {'content': 'ok', 'usage': None}
+
+
+def test_translation_uses_the_whole_budget_without_filtering():
+    llm_scheduler.reset(dict(CONFIG, llm_max_requests=10))
+    results = [llm_scheduler.call(_success, priority=PRIORITY_TRANSLATION) for _ in range(10)]
+    assert all('error' not in result for result in results)
+    assert llm_scheduler.denied == 0
+    llm_scheduler.reset({})
+
+
+def test_filtering_reserve_is_held_only_while_filtering_is_in_progress():
+    llm_scheduler.reset(dict(CONFIG, llm_max_requests=5, llm_max_concurrency=2))
+    started, release = threading.Event(), threading.Event()
+
+    def _blocking_success():
+        started.set()
+        release.wait(5)
+        return _success()
+
+    filtering = threading.Thread(target=llm_scheduler.call, args=(_blocking_success, PRIORITY_FILTERING))
+    filtering.start()
+    assert started.wait(5)
+    # Leave a slot for translation next to the blocked filtering call
+    llm_scheduler.concurrency = 2.0
+    # The filtering call in flight holds back the last 20% (1 request) of the budget
+    assert 'error' not in llm_scheduler.call(_success, priority=PRIORITY_TRANSLATION)
+    assert 'error' not in llm_scheduler.call(_success, priority=PRIORITY_TRANSLATION)
+    assert 'error' not in llm_scheduler.call(_success, priority=PRIORITY_TRANSLATION)
+    assert llm_scheduler.call(_success, priority=PRIORITY_TRANSLATION).get('denied')
+
+    release.set()
+    filtering.join(5)
+    assert 'error' not in llm_scheduler.call(_success, priority=PRIORITY_TRANSLATION)
+    assert llm_scheduler.requests == 5
+    llm_scheduler.reset({})
+
+
+def test_replay_takes_the_recorded_budget_decisions(monkeypatch, tmp_path):
+    config = dict(CONFIG, llm_max_requests=5, llm_max_concurrency=4)
+    cassette_path = str(tmp_path / 'run.cassette.json.gz')
+    papers = _papers(12)
+
+    recording_client = _YesClient(delay=0.01)
+    monkeypatch.setattr(utils, '_get_openai_client', lambda base_url, api_key: recording_client)
+    llm_scheduler.reset(config)
+    with use_cassette(Cassette(cassette_path, 'record')):
+        recorded = [paper.id for paper in filter_papers_using_llm(papers, 'anything', config)]
+    assert len(recorded) == 5
+
+    # Replays race differently than the recording did, but must keep the same papers without calling the server
+    replay_client = _YesClient()
+    monkeypatch.setattr(utils, '_get_openai_client', lambda base_url, api_key: replay_client)
+    for _ in range(10):
+        llm_scheduler.reset(config)
+        with use_cassette(Cassette(cassette_path, 'replay')):
+            replayed = [paper.id for paper in filter_papers_using_llm(papers, 'anything', config)]
+        assert replayed == recorded
+        assert llm_scheduler.denied == 7
+    assert replay_client.calls == 0
+    llm_scheduler.reset({})
@@ -0,0 +1,156 @@
+"""
+PDF enrichment against a local HTTP stand-in for arXiv
+"""
+
+import http.server
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('pypdf')
+
+from cassette import Cassette, use_cassette  # noqa: E402
+from paper import Paper  # noqa: E402
+from pdf_enrich import PdfCache, enrich_papers_with_pdf  # noqa: E402
+
+
+def _make_pdf(text: str, padding: int = 0) -> bytes:
+    """
+    Build a minimal one-page PDF showing `text`
+    """
+    stream = 'BT /F1 12 Tf 72 720 Td ({}) Tj ET'.format(text).encode()
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+    xref_offset = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return pdf + b' ' * padding
+
+
+PDFS = {
+    '/pdf/1': _make_pdf('Affiliation One'),
+    '/pdf/2': _make_pdf('Affiliation Two'),
+    '/pdf/big': _make_pdf('Too Big', padding=300 * 1024),
+    '/pdf/moved': _make_pdf('Moved Paper'),
+}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        if self.path == '/pdf/redirect':
+            self.send_response(301)
+            self.send_header('Location', '/pdf/moved')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = PDFS.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.hits = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _papers(server, *names):
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+    return [Paper(title=name, id=name, abstract='', url='{}/abs/{}'.format(base_url, name), published='') for name in names]
+
+
+def _config(tmp_path, **overrides):
+    config = {'pdf_cache_dir': str(tmp_path / 'cache'), 'pdf_max_workers': 2}
+    config.update(overrides)
+    return config
+
+
+def test_first_page_text_and_cache_hits(server, tmp_path):
+    config = _config(tmp_path)
+    papers = enrich_papers_with_pdf(_papers(server, '1', '2', 'missing'), config)
+    assert [paper.pdf_text for paper in papers] == ['Affiliation One', 'Affiliation Two', None]
+
+    server.hits.clear()
+    papers = enrich_papers_with_pdf(_papers(server, '1', '2'), config)
+    assert [paper.pdf_text for paper in papers] == ['Affiliation One', 'Affiliation Two']
+    assert server.hits == []
+
+
+def test_redirect_is_followed(server, tmp_path):
+    papers = enrich_papers_with_pdf(_papers(server, 'redirect'), _config(tmp_path))
+    assert papers[0].pdf_text == 'Moved Paper'
+
+
+def test_oversized_pdf_is_skipped(server, tmp_path):
+    papers = enrich_papers_with_pdf(_papers(server, 'big', '1'), _config(tmp_path, pdf_max_file_mb=0.1))
+    assert [paper.pdf_text for paper in papers] == [None, 'Affiliation One']
+
+
+def test_byte_budget_stops_downloads(server, tmp_path):
+    budget_mb = (len(PDFS['/pdf/1']) + 10) / 2 ** 20
+    config = _config(tmp_path, pdf_max_workers=1, pdf_download_budget_mb=budget_mb)
+    papers = enrich_papers_with_pdf(_papers(server, '1', '2'), config)
+    assert [paper.pdf_text for paper in papers] == ['Affiliation One', None]
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=250)
+    cache.put('a', b'a' * 100)
+    cache.put('b', b'b' * 100)
+    # Touch `a` so that `b` becomes the least recently used object
+    os.utime(cache._object_path(cache._index['b']), (0, 0))
+    assert cache.get('a') == b'a' * 100
+    cache.put('c', b'c' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') == b'a' * 100
+    assert cache.get('c') == b'c' * 100
+
+
+def test_replay_is_offline_and_ignores_the_cache(server, tmp_path):
+    cassette_path = str(tmp_path / 'run.cassette.json.gz')
+    config = _config(tmp_path, pdf_max_file_mb=0.1)
+    # A warm cache must not hide PDFs from the recording
+    enrich_papers_with_pdf(_papers(server, '1'), config)
+
+    server.hits.clear()
+    with use_cassette(Cassette(cassette_path, 'record')):
+        recorded = enrich_papers_with_pdf(_papers(server, '1', 'big'), config)
+    assert sorted(server.hits) == ['/pdf/1', '/pdf/big']
+
+    server.hits.clear()
+    replay_config = _config(tmp_path / 'cold', pdf_max_file_mb=0.1)
+    with use_cassette(Cassette(cassette_path, 'replay')):
+        replayed = enrich_papers_with_pdf(_papers(server, '1', 'big'), replay_config)
+    assert server.hits == []
+    assert not os.path.exists(replay_config['pdf_cache_dir'])
+    assert [paper.pdf_text for paper in replayed] == [paper.pdf_text for paper in recorded] == ['Affiliation One', None]
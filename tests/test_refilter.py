@@ -0,0 +1,53 @@
+"""
+Bulk keyword re-filter of stored papers
+"""
+
+import json
+import sys
+
+import pytest
+
+import main
+from arxiv_paper import refilter_papers_by_keyword
+
+KEYWORDS = ['molecule', 'protein + language model/models']
+
+
+def _records(count):
+    records = []
+    for i in range(count):
+        topic = ('molecule', 'protein', 'galaxy')[i % 3]
+        records.append({'id': str(i), 'title': 'Paper {} on {}'.format(i, topic), 'abstract': 'Uses a language model.'})
+    return records
+
+
+def _expected_matches(record):
+    matches = []
+    if 'molecule' in record['title']:
+        matches.append('molecule')
+    if 'protein' in record['title']:
+        matches.append('protein + language model/models')
+    return matches
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_matches_are_written_to_their_records_across_chunks(tmp_path, workers):
+    paper_file = tmp_path / 'papers.json'
+    records = _records(11)
+    paper_file.write_text(json.dumps(records), encoding='utf-8')
+
+    # 6 chunks, more than the 2 * workers chunks kept in flight
+    match_counts = refilter_papers_by_keyword(str(paper_file), KEYWORDS, workers=workers, chunk_size=2)
+
+    stored = json.loads(paper_file.read_text(encoding='utf-8'))
+    assert [record['id'] for record in stored] == [record['id'] for record in records]
+    assert [record['keyword_matches'] for record in stored] == [_expected_matches(record) for record in records]
+    assert match_counts == {'molecule': 4, 'protein + language model/models': 4}
+
+
+@pytest.mark.parametrize('workers', ['0', '-2'])
+def test_workers_below_one_are_rejected(monkeypatch, capsys, workers):
+    monkeypatch.setattr(sys, 'argv', ['main.py', '--mode', 'refilter', '--workers', workers])
+    with pytest.raises(SystemExit):
+        main.parse_args()
+    assert '--workers must be at least 1' in capsys.readouterr().err
@@ -2,12 +2,16 @@
 Utility Functions
 """
 
+import functools
 import os
+import threading
 import warnings
 from typing import Optional
 
 import yaml
-from openai import OpenAI
+
+from cassette import active_cassette, request_digest
+from llm_scheduler import PRIORITY_FILTERING, llm_scheduler
 
 warnings.filterwarnings('ignore')
 
@@ -41,12 +45,88 @@ def validate_llm_server_config(config: dict) -> dict:
     return llm_server_config
 
 
-def get_llm_response(prompt: str, config: dict):
+class LLMUsage:
+    """
+    Token usage accumulated over a run, including prompt tokens served from the provider's prefix cache
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.prompt_tokens = 0
+            self.cached_tokens = 0
+            self.completion_tokens = 0
+
+    def record(self, usage: Optional[dict]):
+        """
+        Add the `usage` of a chat completion response, as a dict
+        """
+        if usage is None:
+            return
+        prompt_tokens = usage.get('prompt_tokens') or 0
+        completion_tokens = usage.get('completion_tokens') or 0
+        # DeepSeek reports `prompt_cache_hit_tokens`; OpenAI reports `prompt_tokens_details.cached_tokens`
+        cached_tokens = usage.get('prompt_cache_hit_tokens')
+        if cached_tokens is None:
+            cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens or 0
+            self.completion_tokens += completion_tokens
+
+    def estimate_cost(self, config: dict) -> float:
+        """
+        Estimate the cost from `llm_pricing` (price per million tokens) in the configuration
+        """
+        pricing = config.get('llm_pricing') or {}
+        uncached_tokens = self.prompt_tokens - self.cached_tokens
+        return (
+            uncached_tokens * pricing.get('input', 0.0)
+            + self.cached_tokens * pricing.get('cached_input', 0.0)
+            + self.completion_tokens * pricing.get('output', 0.0)
+        ) / 1e6
+
+    def summary(self, config: dict) -> str:
+        total_tokens = self.prompt_tokens + self.completion_tokens
+        cache_ratio = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        return 'LLM usage: {} requests, {} tokens ({} prompt, {} cached ({:.1%}), {} completion), estimated cost: {:.4f}'.format(
+            self.requests, total_tokens, self.prompt_tokens, self.cached_tokens, cache_ratio,
+            self.completion_tokens, self.estimate_cost(config)
+        )
+
+
+# Usage of all LLM calls in the current run
+llm_usage = LLMUsage()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_openai_client(base_url: str, api_key: str):
+    """
+    One client per server, shared across threads so connections are reused
+    """
+    from openai import OpenAI  # Deferred: the openai stack is only needed once an LLM stage runs
+
+    # Retries are handled by `llm_scheduler`
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0
+    )
+
+
+def get_llm_response(prompt: str, config: dict, system_prompt: Optional[str] = None, priority: int = PRIORITY_FILTERING):
     """
     Get LLM response
-    :param prompt: user prompt
+    :param prompt: user prompt, i.e. the variable part of the request
     :param config: LLM Server configuration, fields include `model`, `base_url`, `api_key` etc.
-    :return: the response content or None if failed
+    :param system_prompt: the stable instructions shared across requests, sent first so providers can cache the prefix
+    :param priority: the scheduling priority, filtering calls are served before translation calls
+    :return: the response content or None if failed or denied by the budget of `llm_scheduler`
     """
     llm_server_config = validate_llm_server_config(config)
     model = llm_server_config['model']
@@ -59,27 +139,48 @@ def get_llm_response(prompt: str, config: dict):
         'stream': False,
     }
 
-    client = OpenAI(
-        api_key=api_key,
-        base_url=base_url
-    )
+    messages = []
+    if system_prompt:
+        messages.append({
+            'role': 'system',
+            'content': system_prompt
+        })
+    messages.append({
+        'role': 'user',
+        'content': prompt
+    })
 
-    messages = [
-        {
-            'role': 'user',
-            'content': prompt
-        },
-    ]
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            **generation_config
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print('LLM Server Error: {}'.format(e))
+    def _create_chat_completion() -> dict:
+        import openai
+
+        client = _get_openai_client(base_url, api_key)
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **generation_config
+            )
+            usage = response.usage.model_dump() if response.usage else None
+            return {'content': response.choices[0].message.content.strip(), 'usage': usage}
+        except Exception as e:
+            status = getattr(e, 'status_code', None)
+            # Rate limits, timeouts, connection errors and server errors are worth retrying
+            transient = isinstance(e, openai.APIConnectionError) or status in (408, 409, 429) or (status or 0) >= 500
+            return {'error': str(e), 'status': status, 'transient': transient}
+
+    digest = None
+    if active_cassette() is not None:
+        digest = request_digest({'model': model, 'messages': messages, **generation_config})
+    result = llm_scheduler.call(_create_chat_completion, priority=priority, exchange_key=digest)
+
+    if result.get('denied'):
+        print('LLM request denied: {}'.format(result['error']))
+        return None
+    if 'error' in result:
+        print('LLM Server Error: {}'.format(result['error']))
         return None
+    llm_usage.record(result['usage'])
+    return result['content']
 
 
 if __name__ == '__main__':